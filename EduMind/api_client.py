@@ -0,0 +1,351 @@
+# EduMind API 请求封装
+# 功能: 可取消的 HTTP 请求(CancelToken), 取消时直接断开连接, 不再等待服务器返回
+#       相同请求合并(SingleFlight), 避免重复发送和重复计费
+#       流式输出(stream_chat), 边生成边处理
+
+import copy
+import hashlib
+import json
+import socket
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 当前线程正在建立的可取消请求(连接建立时登记socket)
+_local = threading.local()
+
+# 流式读取的块大小: 非 chunked 响应时 iter_lines(chunk_size=None) 会读到连接关闭才产出
+STREAM_CHUNK_SIZE = 64
+
+# 确定性请求(temperature=0)的结果缓存时间(秒)和条数上限
+MEMO_TTL = 60
+MEMO_SIZE = 64
+
+
+class CancelledError(Exception):
+    """操作已被取消"""
+
+
+class CancelToken:
+    """取消令牌: 一次会话/一次发送对应一个令牌, 可跨线程取消
+
+    取消后: 正在进行的HTTP请求被断开, 检查点抛出 CancelledError,
+    已注册的回调立即执行(用于释放缓存的图片等)。
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def on_cancel(self, callback):
+        """注册取消回调; 已取消则立即执行"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return callback
+        callback()
+        return callback
+
+    def remove_callback(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise CancelledError()
+
+
+def _shutdown(sock):
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class _Connections:
+    """一次请求建立的连接; 令牌取消时全部 shutdown"""
+
+    def __init__(self, token):
+        self.token = token
+        self.sockets = []
+
+    def add(self, sock):
+        self.sockets.append(sock)
+        if self.token.cancelled:
+            _shutdown(sock)
+
+    def abort(self):
+        for sock in list(self.sockets):
+            _shutdown(sock)
+
+    def post(self, session, url, headers, data, timeout, stream=False):
+        self.token.on_cancel(self.abort)
+        # 建立连接发生在当前线程的 session.post 内, 借线程局部变量登记socket
+        _local.connections = self
+        try:
+            return session.post(url, headers=headers, json=data, timeout=timeout, stream=stream)
+        finally:
+            _local.connections = None
+
+    def release(self):
+        self.token.remove_callback(self.abort)
+
+
+class _TrackedConnectionMixin:
+    """建立连接后把socket登记到当前请求, 取消时由其他线程shutdown"""
+
+    def connect(self):
+        super().connect()
+        connections = getattr(_local, "connections", None)
+        if connections is not None:
+            connections.add(self.sock)
+
+
+# 原连接池类 -> 登记socket的子类(按需生成, 同样适用于代理/SOCKS代理的连接池)
+_tracked_pools = {}
+
+
+def _tracked_pool_class(pool_cls):
+    tracked = _tracked_pools.get(pool_cls)
+    if tracked is None:
+        conn_cls = pool_cls.ConnectionCls
+        tracked_conn = type("Tracked" + conn_cls.__name__, (_TrackedConnectionMixin, conn_cls), {})
+        tracked = type("Tracked" + pool_cls.__name__, (pool_cls,), {"ConnectionCls": tracked_conn})
+        _tracked_pools[pool_cls] = tracked
+    return tracked
+
+
+def _track_manager(manager):
+    """让连接管理器(直连或代理)创建的连接都登记socket"""
+    manager.pool_classes_by_scheme = {
+        scheme: _tracked_pool_class(pool_cls) if not issubclass(pool_cls.ConnectionCls, _TrackedConnectionMixin)
+        else pool_cls
+        for scheme, pool_cls in manager.pool_classes_by_scheme.items()
+    }
+    return manager
+
+
+class _CancellableAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        _track_manager(self.poolmanager)
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        # 设置了 HTTP(S)_PROXY 或系统代理时请求走代理管理器, 同样需要登记
+        return _track_manager(super().proxy_manager_for(proxy, **proxy_kwargs))
+
+
+def _new_session():
+    # 每次请求独立的session, 连接不复用, 断开不影响其他请求
+    session = requests.Session()
+    adapter = _CancellableAdapter()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def post_json(url, headers, data, timeout, token=None):
+    """POST JSON 并返回解析后的响应
+
+    传入 token 时: 取消会立即断开连接并抛出 CancelledError, 不再占用带宽和限流额度。
+    """
+    if token is None:
+        return requests.post(url, headers=headers, json=data, timeout=timeout).json()
+
+    token.raise_if_cancelled()
+    connections = _Connections(token)
+    session = _new_session()
+    try:
+        resp = connections.post(session, url, headers, data, timeout)
+        token.raise_if_cancelled()
+        return resp.json()
+    except (requests.RequestException, ValueError):
+        if token.cancelled:
+            raise CancelledError()
+        raise
+    finally:
+        connections.release()
+        session.close()
+
+
+def stream_chat(url, headers, data, timeout, token=None):
+    """流式请求(SSE), 逐段产出模型输出的文本增量
+
+    生成器提前关闭或令牌取消时立即断开连接。
+    """
+    token = token or CancelToken()
+    token.raise_if_cancelled()
+    data = dict(data, stream=True)
+    connections = _Connections(token)
+    session = _new_session()
+    try:
+        resp = connections.post(session, url, headers, data, timeout, stream=True)
+        if resp.status_code != 200:
+            try:
+                message = resp.json().get("message", resp.text)
+            except ValueError:
+                message = resp.text
+            raise RuntimeError(f"HTTP {resp.status_code}: {message}")
+        for line in resp.iter_lines(chunk_size=STREAM_CHUNK_SIZE):
+            # 取消时连接被断开, 读到的是 EOF 而不是异常, 不能当作正常结束
+            token.raise_if_cancelled()
+            if not line.startswith(b"data:"):
+                continue
+            payload = line[5:].strip()
+            if payload == b"[DONE]":
+                break
+            chunk = json.loads(payload)
+            choices = chunk.get("choices") or [{}]
+            delta = (choices[0].get("delta") or {}).get("content")
+            if delta:
+                yield delta
+        token.raise_if_cancelled()
+    except (requests.RequestException, ValueError):
+        if token.cancelled:
+            raise CancelledError()
+        raise
+    finally:
+        connections.release()
+        session.close()
+
+
+def request_key(url, headers, data):
+    """规范化请求体(键排序、紧凑格式)后取哈希, 相同模型/消息/参数得到相同的键"""
+    body = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    h = hashlib.sha256()
+    # 不同账号的请求不合并
+    for part in (url, headers.get("Authorization", ""), body):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class _Flight:
+    """一个正在进行的实际请求, 可被多个调用者共享"""
+
+    def __init__(self, key):
+        self.key = key
+        self.future = Future()
+        self.token = CancelToken()
+        self.waiters = 0
+
+
+class SingleFlight:
+    """请求合并层: 放在 post_json 前面
+
+    - 同时发出的相同请求只真正发送一次, 后来者等待同一个结果
+    - temperature=0 的请求成功后在 MEMO_TTL 秒内直接复用结果
+    - 某个调用者取消只影响它自己; 所有调用者都取消后才断开实际请求
+    """
+
+    def __init__(self, memo_ttl=MEMO_TTL, memo_size=MEMO_SIZE):
+        self.memo_ttl = memo_ttl
+        self.memo_size = memo_size
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._memo = OrderedDict()  # 键 -> (过期时间, 结果)
+
+    def post_json(self, url, headers, data, timeout, token=None):
+        if token is not None:
+            token.raise_if_cancelled()
+        key = request_key(url, headers, data)
+        deterministic = data.get("temperature") == 0 and not data.get("stream")
+
+        with self._lock:
+            if deterministic:
+                result = self._memo_get(key)
+                if result is not None:
+                    return copy.deepcopy(result)
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = _Flight(key)
+                self._flights[key] = flight
+                threading.Thread(target=self._run,
+                                 args=(flight, url, headers, data, timeout, deterministic),
+                                 daemon=True).start()
+            flight.waiters += 1
+
+        wake = threading.Event()
+        flight.future.add_done_callback(lambda f: wake.set())
+        if token is not None:
+            token.on_cancel(wake.set)
+        try:
+            wake.wait()
+            if token is not None and token.cancelled and not flight.future.done():
+                raise CancelledError()
+            # 每个调用者拿到独立副本, 互不影响
+            return copy.deepcopy(flight.future.result())
+        finally:
+            if token is not None:
+                token.remove_callback(wake.set)
+            self._detach(flight)
+
+    def _run(self, flight, url, headers, data, timeout, deterministic):
+        try:
+            result = post_json(url, headers, data, timeout, flight.token)
+        except BaseException as e:
+            self._finish(flight)
+            flight.future.set_exception(e)
+            return
+        if deterministic and isinstance(result, dict) and "choices" in result:
+            with self._lock:
+                self._memo_put(flight.key, result)
+        self._finish(flight)
+        flight.future.set_result(result)
+
+    def _finish(self, flight):
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    def _detach(self, flight):
+        """调用者离开; 已经没人等待的请求直接断开"""
+        with self._lock:
+            flight.waiters -= 1
+            if flight.waiters > 0 or flight.future.done():
+                return
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        flight.token.cancel()
+
+    def _memo_get(self, key):
+        entry = self._memo.get(key)
+        if entry is None:
+            return None
+        expires, result = entry
+        if expires < time.monotonic():
+            del self._memo[key]
+            return None
+        return result
+
+    def _memo_put(self, key, result):
+        self._memo[key] = (time.monotonic() + self.memo_ttl, result)
+        self._memo.move_to_end(key)
+        while len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+
+
+# 默认的全局合并层, 界面和批处理共用同一个实例才能互相合并
+coalescer = SingleFlight()
@@ -1,13 +1,17 @@
 # EduMind 聊天原型
-# 功能: 选择模型、发送消息、上传文件(图片/txt/pdf)
+# 功能: 选择模型、发送消息、上传文件(图片/txt/pdf)、本地搜索处理过的资料
 
 import sys
 import os
 import base64
+import hashlib
 import threading
+import time
 import tkinter as tk
 from tkinter import ttk, scrolledtext, filedialog, messagebox
-import requests
+
+from api_client import CancelToken, CancelledError, coalescer
+from search_index import SearchIndex
 
 # PDF支持(可选)
 try:
@@ -28,6 +32,142 @@ MODELS = {
     "DeepSeek-OCR": "deepseek-ai/DeepSeek-OCR",
 }
 
+# 聊天记录显示参数
+TRANSCRIPT_MAX_MESSAGES = 200  # 控件中最多保留的消息条数, 更早的移出控件(仍保存在内存中)
+TRANSCRIPT_PAGE_SIZE = 50  # 点击"加载更早消息"时每次载入的条数
+TRANSCRIPT_FOLD_CHARS = 2000  # 超过此长度的消息折叠显示
+TRANSCRIPT_PREVIEW_CHARS = 300  # 折叠后显示的前缀长度
+TRANSCRIPT_FLUSH_MS = 16  # 批量插入的间隔(约一帧)
+
+
+class TranscriptView:
+    """聊天记录视图: 消息保存在内存列表中, 控件里只放最近一部分
+
+    - 同一帧内的多条消息合并为一次插入
+    - 过长的消息(附件内容、OCR结果)折叠为占位符, 点击展开
+    - 超过上限的旧消息移出控件, 顶部提供"加载更早消息"
+    """
+
+    def __init__(self, text_widget):
+        self.text = text_widget
+        self.messages = []  # [{"role", "content", "expanded"}]
+        self.first_shown = 0  # 控件中第一条消息在 messages 中的下标
+        self._queue = []  # 等待插入控件的消息下标
+        self._flush_id = None
+
+        self.text.tag_config("fold", foreground="#1a73e8", underline=True)
+        self.text.tag_config("older", foreground="#1a73e8", justify=tk.CENTER)
+        self.text.tag_bind("fold", "<Button-1>", self.on_fold_click)
+        self.text.tag_bind("older", "<Button-1>", self.on_older_click)
+        for tag in ("fold", "older"):
+            self.text.tag_bind(tag, "<Enter>", lambda e: self.text.config(cursor="hand2"))
+            self.text.tag_bind(tag, "<Leave>", lambda e: self.text.config(cursor=""))
+
+    def append(self, role, content):
+        self.messages.append({"role": role, "content": content, "expanded": False})
+        self._queue.append(len(self.messages) - 1)
+        if self._flush_id is None:
+            self._flush_id = self.text.after(TRANSCRIPT_FLUSH_MS, self.flush)
+
+    def clear(self):
+        if self._flush_id is not None:
+            self.text.after_cancel(self._flush_id)
+            self._flush_id = None
+        self._delete_tags(self.first_shown, len(self.messages))
+        self.messages = []
+        self._queue = []
+        self.first_shown = 0
+        self.text.config(state=tk.NORMAL)
+        self.text.delete(1.0, tk.END)
+        self.text.config(state=tk.DISABLED)
+
+    def flush(self):
+        """把排队的消息一次性插入控件"""
+        self._flush_id = None
+        if not self._queue:
+            return
+        # 用户正在看上面的内容时不强制滚到底部
+        at_bottom = self.text.yview()[1] >= 0.999
+        self.text.config(state=tk.NORMAL)
+        for idx in self._queue:
+            self._insert_message(tk.END, idx)
+        self._queue = []
+        # 用户在上面翻看(包括刚载入的更早消息)时不裁剪, 回到底部后再裁剪
+        if at_bottom:
+            self._trim()
+        self.text.config(state=tk.DISABLED)
+        if at_bottom:
+            self.text.see(tk.END)
+
+    def _insert_message(self, index, idx):
+        msg = self.messages[idx]
+        tags = (msg["role"], f"m{idx}")
+        prefix = "你" if msg["role"] == "user" else "AI"
+        content = msg["content"]
+        if msg["expanded"] or len(content) <= TRANSCRIPT_FOLD_CHARS:
+            self.text.insert(index, f"\n{prefix}: {content}\n", tags)
+            return
+        placeholder = f"... [展开全部, 共{len(content)}字]"
+        self.text.insert(index,
+                         f"\n{prefix}: {content[:TRANSCRIPT_PREVIEW_CHARS]}", tags,
+                         placeholder, tags + ("fold", f"fold{idx}"),
+                         "\n", tags)
+
+    def _trim(self):
+        """控件内消息超过上限时, 移除最早的消息"""
+        shown = len(self.messages) - self.first_shown
+        if shown <= TRANSCRIPT_MAX_MESSAGES:
+            return
+        keep_from = len(self.messages) - TRANSCRIPT_MAX_MESSAGES
+        start = self.text.tag_ranges(f"m{keep_from}")[0]
+        self.text.delete(1.0, start)
+        self._delete_tags(self.first_shown, keep_from)
+        self.first_shown = keep_from
+        self._insert_older_header()
+
+    def _delete_tags(self, first, last):
+        # 每条消息各有 m{idx}/fold{idx} 标签, 文字删除后标签仍留在控件里, 长时间会话要一并删除
+        for idx in range(first, last):
+            self.text.tag_delete(f"m{idx}", f"fold{idx}")
+
+    def _insert_older_header(self):
+        if self.first_shown > 0:
+            self.text.insert(1.0, f"[已隐藏更早的 {self.first_shown} 条消息, 点击加载]\n", ("older",))
+
+    def on_older_click(self, event):
+        """载入更早的一页消息到控件顶部"""
+        first = max(0, self.first_shown - TRANSCRIPT_PAGE_SIZE)
+        self.text.config(state=tk.NORMAL)
+        header = self.text.tag_ranges("older")
+        if header:
+            self.text.delete(header[0], header[1])
+        # 倒序插到开头, 保持原顺序
+        for idx in range(self.first_shown - 1, first - 1, -1):
+            self._insert_message(1.0, idx)
+        self.first_shown = first
+        self._insert_older_header()
+        self.text.config(state=tk.DISABLED)
+        return "break"
+
+    def on_fold_click(self, event):
+        """把折叠的占位符替换为剩余内容"""
+        for tag in self.text.tag_names(tk.CURRENT):
+            if tag.startswith("fold") and tag != "fold":
+                idx = int(tag[4:])
+                break
+        else:
+            return "break"
+        msg = self.messages[idx]
+        msg["expanded"] = True
+        start, end = self.text.tag_ranges(f"fold{idx}")
+        self.text.config(state=tk.NORMAL)
+        self.text.delete(start, end)
+        self.text.tag_delete(f"fold{idx}")
+        self.text.insert(start, msg["content"][TRANSCRIPT_PREVIEW_CHARS:], (msg["role"], f"m{idx}"))
+        self.text.config(state=tk.DISABLED)
+        return "break"
+
+
 class ChatApp:
     def __init__(self, root):
         self.root = root
@@ -36,6 +176,15 @@ class ChatApp:
 
         self.conversation = []  # 对话历史
         self.attached_files = []  # 当前附件
+        self.cancel_token = None  # 正在进行的请求的取消令牌
+
+        # 本地全文索引(处理过的文本/OCR结果); 打开失败(不支持FTS5、目录不可写、数据库损坏等)时不可用
+        self.search_index_error = None
+        try:
+            self.search_index = SearchIndex()
+        except Exception as e:
+            self.search_index = None
+            self.search_index_error = str(e)
 
         self.setup_ui()
 
@@ -51,6 +200,7 @@ class ChatApp:
         model_combo.pack(side=tk.LEFT, padx=5)
 
         ttk.Button(top_frame, text="清空对话", command=self.clear_chat).pack(side=tk.RIGHT)
+        ttk.Button(top_frame, text="🔍 搜索资料", command=self.open_search).pack(side=tk.RIGHT, padx=5)
 
         # 中部: 聊天记录
         chat_frame = ttk.Frame(self.root, padding=10)
@@ -60,6 +210,7 @@ class ChatApp:
                                                        font=("Microsoft YaHei", 10))
         self.chat_display.pack(fill=tk.BOTH, expand=True)
         self.chat_display.config(state=tk.DISABLED)
+        self.transcript = TranscriptView(self.chat_display)
 
         # 附件显示区
         self.attach_frame = ttk.Frame(self.root, padding=5)
@@ -78,6 +229,8 @@ class ChatApp:
         self.input_text.bind("<Return>", self.on_enter)
         self.input_text.bind("<Shift-Return>", lambda e: None)  # Shift+Enter换行
 
+        self.stop_btn = ttk.Button(input_frame, text="停止", command=self.stop_request, state=tk.DISABLED)
+        self.stop_btn.pack(side=tk.RIGHT, padx=(5, 0))
         self.send_btn = ttk.Button(input_frame, text="发送", command=self.send_message)
         self.send_btn.pack(side=tk.RIGHT)
 
@@ -95,12 +248,12 @@ class ChatApp:
             self.attach_label.config(text=f"附件: {', '.join(names)}")
 
     def clear_chat(self):
+        # 清空即开始新会话: 旧请求立即中断, 迟到的结果丢弃
+        self.cancel_request()
         self.conversation = []
         self.attached_files = []
         self.attach_label.config(text="")
-        self.chat_display.config(state=tk.NORMAL)
-        self.chat_display.delete(1.0, tk.END)
-        self.chat_display.config(state=tk.DISABLED)
+        self.transcript.clear()
 
     def on_enter(self, event):
         if not event.state & 0x1:  # 没按Shift
@@ -108,13 +261,31 @@ class ChatApp:
             return "break"
 
     def append_chat(self, role, content):
-        self.chat_display.config(state=tk.NORMAL)
-        if role == "user":
-            self.chat_display.insert(tk.END, f"\n你: {content}\n", "user")
-        else:
-            self.chat_display.insert(tk.END, f"\nAI: {content}\n", "ai")
-        self.chat_display.see(tk.END)
-        self.chat_display.config(state=tk.DISABLED)
+        self.transcript.append("user" if role == "user" else "ai", content)
+
+    def cancel_request(self):
+        """取消正在进行的请求(断开连接、停止渲染PDF页面), 返回是否有请求被取消"""
+        token, self.cancel_token = self.cancel_token, None
+        self.send_btn.config(state=tk.NORMAL)
+        self.stop_btn.config(state=tk.DISABLED)
+        if token is None:
+            return False
+        token.cancel()
+        return True
+
+    def stop_request(self):
+        if self.cancel_request():
+            self.append_chat("ai", "[已停止]")
+
+    def post_ui(self, token, func):
+        """把结果交给UI线程执行; 令牌已取消(已停止/已清空)则直接丢弃"""
+        self.root.after(0, lambda: None if token.cancelled else func())
+
+    def finish_request(self, token):
+        if self.cancel_token is token:
+            self.cancel_token = None
+            self.send_btn.config(state=tk.NORMAL)
+            self.stop_btn.config(state=tk.DISABLED)
 
     def send_message(self):
         user_input = self.input_text.get(1.0, tk.END).strip()
@@ -123,6 +294,7 @@ class ChatApp:
 
         self.input_text.delete(1.0, tk.END)
         self.send_btn.config(state=tk.DISABLED)
+        self.stop_btn.config(state=tk.NORMAL)
 
         # 显示用户消息
         display_text = user_input
@@ -131,10 +303,19 @@ class ChatApp:
             display_text += f"\n[附件: {', '.join(names)}]"
         self.append_chat("user", display_text)
 
+        # 附件随本次请求带走
+        files = self.attached_files
+        self.attached_files = []
+        self.attach_label.config(text="")
+
         # 异步发送
-        threading.Thread(target=self.call_api, args=(user_input,), daemon=True).start()
+        token = CancelToken()
+        self.cancel_token = token
+        threading.Thread(target=self.call_api, args=(user_input, files, token), daemon=True).start()
 
-    def call_api(self, user_input):
+    def call_api(self, user_input, files, token):
+        # 记住发送时的会话, 清空对话后旧请求不会写入新会话
+        conversation = self.conversation
         try:
             model_name = self.model_var.get()
             model_id = MODELS[model_name]
@@ -142,7 +323,8 @@ class ChatApp:
 
             # 检查是否有扫描PDF需要强制使用视觉模型
             has_scan_pdf = False
-            for filepath in self.attached_files:
+            for filepath in files:
+                token.raise_if_cancelled()
                 if filepath.lower().endswith(".pdf"):
                     text = self.read_pdf_file(filepath)
                     if text is None:
@@ -153,10 +335,10 @@ class ChatApp:
             if has_scan_pdf and not is_vision:
                 model_id = "deepseek-ai/deepseek-vl2"
                 is_vision = True
-                self.root.after(0, lambda: self.append_chat("ai", "[检测到扫描PDF，自动切换到VL2视觉模型]"))
+                self.post_ui(token, lambda: self.append_chat("ai", "[检测到扫描PDF，自动切换到VL2视觉模型]"))
 
             # 构建消息内容
-            content = self.build_content(user_input, is_vision)
+            content = self.build_content(user_input, files, is_vision, token)
 
             headers = {
                 "Authorization": f"Bearer {API_KEY}",
@@ -164,12 +346,12 @@ class ChatApp:
             }
 
             # 视觉模型不支持带图片的多轮对话，只发当前消息
+            user_message = {"role": "user", "content": content}
             if is_vision:
-                messages = [{"role": "user", "content": content}]
+                messages = [user_message]
             else:
-                # 文本模型可以用对话历史
-                self.conversation.append({"role": "user", "content": content})
-                messages = self.conversation
+                # 文本模型可以用对话历史(成功后才写入历史, 取消的请求不留痕迹)
+                messages = conversation + [user_message]
 
             data = {
                 "model": model_id,
@@ -178,36 +360,39 @@ class ChatApp:
                 "stream": False
             }
 
-            resp = requests.post(BASE_URL, headers=headers, json=data, timeout=120)
-            result = resp.json()
+            result = coalescer.post_json(BASE_URL, headers, data, 120, token)
 
             if "choices" in result:
                 ai_response = result["choices"][0]["message"]["content"]
                 # 只有文本模型才保存历史
-                if not is_vision:
-                    self.conversation.append({"role": "assistant", "content": ai_response})
-                self.root.after(0, lambda: self.append_chat("ai", ai_response))
+                if not is_vision and not token.cancelled:
+                    conversation.append(user_message)
+                    conversation.append({"role": "assistant", "content": ai_response})
+                self.post_ui(token, lambda: self.append_chat("ai", ai_response))
+                if is_vision:
+                    self.index_vision_result(files, model_id, user_input, ai_response)
             else:
                 error_msg = result.get("message", str(result))
-                self.root.after(0, lambda: self.append_chat("ai", f"[错误] {error_msg}"))
+                self.post_ui(token, lambda: self.append_chat("ai", f"[错误] {error_msg}"))
+
+        except CancelledError:
+            pass
 
         except Exception as e:
-            self.root.after(0, lambda: self.append_chat("ai", f"[异常] {str(e)}"))
+            self.post_ui(token, lambda: self.append_chat("ai", f"[异常] {str(e)}"))
 
         finally:
-            self.attached_files = []
-            self.root.after(0, lambda: self.attach_label.config(text=""))
-            self.root.after(0, lambda: self.send_btn.config(state=tk.NORMAL))
+            self.post_ui(token, lambda: self.finish_request(token))
 
-    def build_content(self, user_input, is_vision):
+    def build_content(self, user_input, files, is_vision, token=None):
         """构建API消息内容,处理附件"""
 
-        if not self.attached_files:
+        if not files:
             return user_input
 
         # 检查是否有PDF需要视觉处理
         has_scan_pdf = False
-        for filepath in self.attached_files:
+        for filepath in files:
             if filepath.lower().endswith(".pdf"):
                 text = self.read_pdf_file(filepath)
                 if text is None:  # 扫描件
@@ -223,7 +408,7 @@ class ChatApp:
             # 视觉模型: 使用多模态格式，强制中文回复
             prompt = user_input + "\n(请用中文回答)"
             content = [{"type": "text", "text": prompt}]
-            for filepath in self.attached_files:
+            for filepath in files:
                 ext = os.path.splitext(filepath)[1].lower()
                 if ext in [".png", ".jpg", ".jpeg"]:
                     b64 = self.file_to_base64(filepath)
@@ -239,7 +424,7 @@ class ChatApp:
                     if text:  # 有文字的PDF
                         content[0]["text"] += f"\n\n[PDF内容: {os.path.basename(filepath)}]\n{text}"
                     else:  # 扫描件，转图片
-                        images = self.pdf_to_images_base64(filepath)
+                        images = self.pdf_to_images_base64(filepath, token=token)
                         content[0]["text"] += f"\n\n[PDF扫描件: {os.path.basename(filepath)}, 共{len(images)}页]"
                         for b64 in images:
                             content.append({
@@ -250,7 +435,7 @@ class ChatApp:
         else:
             # 纯文本模型: 把所有内容转成文本
             text_parts = [user_input]
-            for filepath in self.attached_files:
+            for filepath in files:
                 ext = os.path.splitext(filepath)[1].lower()
                 if ext == ".txt":
                     text = self.read_text_file(filepath)
@@ -274,9 +459,11 @@ class ChatApp:
         for enc in encodings:
             try:
                 with open(filepath, "r", encoding=enc) as f:
-                    return f.read()
+                    text = f.read()
             except:
                 continue
+            self.index_page(filepath, 1, text)
+            return text
         return "[无法读取文件]"
 
     def read_pdf_file(self, filepath):
@@ -286,8 +473,10 @@ class ChatApp:
         try:
             doc = fitz.open(filepath)
             text_parts = []
-            for page in doc:
-                text_parts.append(page.get_text())
+            for i, page in enumerate(doc):
+                page_text = page.get_text()
+                text_parts.append(page_text)
+                self.index_page(filepath, i + 1, page_text)
             doc.close()
             text = "\n".join(text_parts).strip()
             if len(text) < 20:  # 文字太少，可能是扫描件
@@ -296,15 +485,15 @@ class ChatApp:
         except Exception as e:
             return f"[PDF读取错误: {e}]"
 
-    def pdf_to_images_base64(self, filepath, max_pages=3):
-        """将PDF转为图片base64列表（用于扫描件）"""
+    def pdf_to_images_base64(self, filepath, max_pages=3, token=None):
+        """将PDF转为图片base64列表（用于扫描件），令牌取消后停止渲染剩余页面"""
         if not PDF_SUPPORT:
             return []
         try:
             doc = fitz.open(filepath)
             images = []
             for i, page in enumerate(doc):
-                if i >= max_pages:
+                if i >= max_pages or (token is not None and token.cancelled):
                     break
                 # 渲染为图片，降低分辨率到100dpi以减少token
                 mat = fitz.Matrix(100/72, 100/72)
@@ -319,6 +508,93 @@ class ChatApp:
             return []
 
 
+    def index_page(self, filepath, page, text, source="text"):
+        """把一页内容写入本地索引(内容未变化时不重复写入)"""
+        if self.search_index is None:
+            return
+        try:
+            self.search_index.add_page(filepath, page, text, source)
+        except Exception:
+            pass
+
+    def index_vision_result(self, files, model_id, user_input, response):
+        """视觉模型的结果写入索引
+
+        只有OCR模型识别单张图片/单页扫描件时, 结果才是该页的OCR文本, 记为 source="ocr", 页码为1;
+        其他情况(普通提问、多页一起发送无法区分页)记为模型回答, 每个附件各存一条, 不带页码,
+        同一附件的不同问题分别保存, 互不覆盖。
+        """
+        if "ocr" in model_id.lower() and len(files) == 1 and self.is_single_image_page(files[0]):
+            self.index_page(files[0], 1, response, source="ocr")
+            return
+        source = "answer:" + hashlib.sha1(user_input.encode("utf-8")).hexdigest()[:12]
+        text = f"问: {user_input}\n答: {response}" if user_input else response
+        for filepath in files:
+            self.index_page(filepath, 0, text, source=source)
+
+    def is_single_image_page(self, filepath):
+        """图片, 或只有一页的扫描PDF"""
+        ext = os.path.splitext(filepath)[1].lower()
+        if ext in [".png", ".jpg", ".jpeg"]:
+            return True
+        if ext != ".pdf" or not PDF_SUPPORT:
+            return False
+        try:
+            doc = fitz.open(filepath)
+            page_count = len(doc)
+            doc.close()
+        except Exception:
+            return False
+        return page_count == 1 and self.read_pdf_file(filepath) is None
+
+    def open_search(self):
+        """搜索面板: 在本地索引中检索处理过的资料, 不调用模型"""
+        if self.search_index is None:
+            message = f"本地搜索不可用: {self.search_index_error}"
+            if "fts5" in (self.search_index_error or "").lower():
+                message += "\n(当前Python的SQLite不支持FTS5)"
+            messagebox.showwarning("搜索资料", message)
+            return
+
+        win = tk.Toplevel(self.root)
+        win.title("搜索资料")
+        win.geometry("700x500")
+
+        bar = ttk.Frame(win, padding=10)
+        bar.pack(fill=tk.X)
+        query_var = tk.StringVar()
+        entry = ttk.Entry(bar, textvariable=query_var)
+        entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        status = ttk.Label(bar, text="")
+        status.pack(side=tk.RIGHT, padx=(10, 0))
+
+        results = scrolledtext.ScrolledText(win, wrap=tk.WORD, font=("Microsoft YaHei", 10))
+        results.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+        results.tag_config("ref", foreground="#1a73e8")
+
+        def do_search(event=None):
+            start = time.perf_counter()
+            hits = self.search_index.search(query_var.get())
+            elapsed = (time.perf_counter() - start) * 1000
+            status.config(text=f"{len(hits)} 条结果, {elapsed:.1f} ms")
+            results.config(state=tk.NORMAL)
+            results.delete(1.0, tk.END)
+            for hit in hits:
+                page = f" 第{hit['page']}页" if hit["page"] else ""
+                if hit["source"] == "ocr":
+                    source = " (OCR)"
+                elif hit["source"].startswith("answer"):
+                    source = " (模型回答)"
+                else:
+                    source = ""
+                results.insert(tk.END, f"{os.path.basename(hit['doc'])}{page}{source}\n", "ref")
+                results.insert(tk.END, f"{hit['snippet']}\n\n")
+            results.config(state=tk.DISABLED)
+
+        entry.bind("<Return>", do_search)
+        ttk.Button(bar, text="搜索", command=do_search).pack(side=tk.LEFT, padx=5)
+        entry.focus_set()
+
 if __name__ == "__main__":
     root = tk.Tk()
     app = ChatApp(root)
@@ -0,0 +1,184 @@
+# EduMind 知识点去重
+# 功能: 分批/重叠抽取会产生重复的知识点, 用字符 n-gram 上的 MinHash + LSH 找出近似重复,
+#       近线性时间合并(不做两两比较), 合并时保留所有来源页码
+#
+# 知识点为 .zsd 中的 dict 格式(id/title/content/type/level/parentId/children/...),
+# 来源页码放在 "sourcePages" 列表中。
+
+import re
+import zlib
+
+NGRAM = 3  # 字符 n-gram 长度(中文按字切分, 不依赖分词)
+NUM_PERM = 64  # MinHash 签名长度
+BANDS = 16  # LSH 分段数(每段 NUM_PERM // BANDS 行), 约 0.5 相似度以上成为候选
+DUP_THRESHOLD = 0.7  # 候选的实际 Jaccard 相似度达到此值才合并
+
+# 单次哈希分桶(one permutation hashing): 每个 n-gram 只算一次哈希, 高位决定桶, 低位参与取最小,
+# 代替 NUM_PERM 次独立置换, 签名计算与文本长度成线性。乘数固定, 保证不同进程/批次签名一致
+_MASK64 = (1 << 64) - 1
+_MULT = 0x9E3779B97F4A7C15
+_BIN_BITS = (NUM_PERM - 1).bit_length()
+_VALUE_BITS = 64 - _BIN_BITS
+_VALUE_MASK = (1 << _VALUE_BITS) - 1
+
+# 只去掉空白和中英文句读标点; 运算符、比较符、括号等数学符号必须保留,
+# 否则 (a+b)^2 与 (a-b)^2 会被当成同一条
+_NOISE_RE = re.compile(r"\s+|[，。、；：？！“”‘’「」『』…·,;:?!\"']|\.(?!\d)")
+
+
+def shingles(text, n=NGRAM):
+    """规范化后切成字符 n-gram 集合(32位哈希)"""
+    text = _NOISE_RE.sub("", text).lower()
+    if len(text) <= n:
+        return {zlib.crc32(text.encode("utf-8"))} if text else set()
+    return {zlib.crc32(text[i:i + n].encode("utf-8")) for i in range(len(text) - n + 1)}
+
+
+def minhash(shingle_set):
+    """计算 MinHash 签名(单次哈希分桶 + 旋转填充空桶)"""
+    if not shingle_set:
+        return None
+    bins = [None] * NUM_PERM
+    for x in shingle_set:
+        h = (x * _MULT) & _MASK64
+        i = h >> _VALUE_BITS
+        v = h & _VALUE_MASK
+        if bins[i] is None or v < bins[i]:
+            bins[i] = v
+    # 空桶取右侧最近的非空桶, 加上距离偏移, 避免短文本的空桶互相"相等"
+    signature = []
+    for i in range(NUM_PERM):
+        j = 0
+        while bins[(i + j) % NUM_PERM] is None:
+            j += 1
+        signature.append(bins[(i + j) % NUM_PERM] + (j << _VALUE_BITS))
+    return tuple(signature)
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class MinHashLSH:
+    """LSH 分桶: 签名切成 BANDS 段, 任意一段完全相同的条目成为候选"""
+
+    def __init__(self, bands=BANDS):
+        self.bands = bands
+        self.rows = NUM_PERM // bands
+        self._buckets = [{} for _ in range(bands)]
+
+    def _band_keys(self, signature):
+        for i in range(self.bands):
+            yield i, signature[i * self.rows:(i + 1) * self.rows]
+
+    def candidates(self, signature):
+        found = set()
+        for i, band in self._band_keys(signature):
+            found.update(self._buckets[i].get(band, ()))
+        return found
+
+    def add(self, key, signature):
+        for i, band in self._band_keys(signature):
+            self._buckets[i].setdefault(band, []).append(key)
+
+
+class KnowledgeDeduper:
+    """跨批次的知识点去重器
+
+    每批结果调用 add(), 与之前所有批次的知识点比较; 重复项并入已有知识点,
+    返回本批中真正新增的知识点。被合并掉的 id 记录在 id_map 中, 以便重写 parentId/children。
+    """
+
+    def __init__(self, threshold=DUP_THRESHOLD):
+        self.threshold = threshold
+        self.points = []  # 保留下来的知识点(按加入顺序)
+        self.id_map = {}  # 被合并的 id -> 保留的 id
+        self._lsh = MinHashLSH()
+        self._shingles = []  # 与 points 一一对应
+
+    def add(self, points):
+        added = []
+        for point in points:
+            content = point.get("content") or ""
+            sh = shingles(content)
+            signature = minhash(sh)
+            if signature is not None:
+                target = self._find_duplicate(point, sh, signature)
+                if target is not None:
+                    self._merge(target, point, signature)
+                    continue
+            point = dict(point)
+            point["sourcePages"] = sorted(set(point.get("sourcePages") or []))
+            if signature is not None:
+                self._lsh.add(len(self.points), signature)
+            self.points.append(point)
+            self._shingles.append(sh)
+            added.append(point)
+        self._remap_refs(added)
+        return added
+
+    def _find_duplicate(self, point, sh, signature):
+        best, best_score = None, self.threshold
+        for idx in self._lsh.candidates(signature):
+            other = self.points[idx]
+            # 类型不同(如定理与例题)不合并
+            if point.get("type") != other.get("type"):
+                continue
+            # 题号不同的习题即使题干相似也不是同一题
+            if point.get("questionNumber") and other.get("questionNumber") \
+                    and point["questionNumber"] != other["questionNumber"]:
+                continue
+            score = jaccard(sh, self._shingles[idx])
+            if score >= best_score:
+                best, best_score = idx, score
+        return best
+
+    def _merge(self, idx, dup, signature):
+        kept = self.points[idx]
+        pages = set(kept.get("sourcePages") or []) | set(dup.get("sourcePages") or [])
+        kept["sourcePages"] = sorted(pages)
+        # 保留更完整的表述(不做总结式缩写)
+        if len(dup.get("content") or "") > len(kept.get("content") or ""):
+            kept["content"] = dup["content"]
+            self._shingles[idx] = shingles(dup["content"]) | self._shingles[idx]
+            # 较长的表述也登记到分桶, 后续与它相似的条目同样能找到这里
+            self._lsh.add(idx, signature)
+        if dup.get("answer") and not kept.get("answer"):
+            kept["answer"] = dup["answer"]
+            kept["hasAnswer"] = True
+        if dup.get("id") is not None and dup.get("id") != kept.get("id"):
+            self.id_map[dup["id"]] = kept.get("id")
+        # 重复项的子节点改挂到保留的知识点下, 与子节点被改写的 parentId 保持一致
+        if dup.get("children"):
+            children = list(kept.get("children") or [])
+            for child in dup["children"]:
+                child = self.id_map.get(child, child)
+                if child != kept.get("id") and child not in children:
+                    children.append(child)
+            kept["children"] = children
+
+    def _remap_refs(self, points):
+        """把指向被合并知识点的 parentId/children 改为指向保留的知识点"""
+        if not self.id_map:
+            return
+        for point in points:
+            pid = point.get("parentId")
+            if pid in self.id_map:
+                point["parentId"] = self.id_map[pid]
+            children = point.get("children")
+            if children:
+                remapped = []
+                for child in children:
+                    child = self.id_map.get(child, child)
+                    if child != point.get("id") and child not in remapped:
+                        remapped.append(child)
+                point["children"] = remapped
+
+
+def dedupe_knowledge_points(points, threshold=DUP_THRESHOLD):
+    """一次性去重一组知识点, 返回合并后的列表"""
+    deduper = KnowledgeDeduper(threshold)
+    deduper.add(points)
+    return deduper.points
@@ -0,0 +1,148 @@
+# EduMind 本地全文检索
+# 功能: 把每页文本/OCR结果写入 SQLite FTS5 索引, 本地毫秒级检索, 不需要调用模型
+#
+# sqlite3 模块无法注册自定义分词器, 所以在 Python 里先分词:
+# 中日韩文字切成相邻二元组(bigram), 其他文字按单词小写, 以空格拼接后交给 unicode61 分词器。
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".edumind", "search_index.db")
+
+# 中日韩文字(汉字、假名、谚文)
+_CJK = "぀-ヿ㐀-䶿一-鿿가-힯豈-﫿"
+CJK_RE = re.compile(f"[{_CJK}]+")
+WORD_RE = re.compile(f"[{_CJK}]+|[^\\W{_CJK}]+")
+
+SNIPPET_CHARS = 40  # 摘要中命中位置前后各保留的字数
+
+
+def tokenize(text):
+    """分词: 中日韩文字切成二元组, 单字保留为一元; 其他按单词小写"""
+    tokens = []
+    for word in WORD_RE.findall(text):
+        if CJK_RE.fullmatch(word):
+            if len(word) == 1:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word.lower())
+    return tokens
+
+
+class SearchIndex:
+    """文档页面全文索引(线程安全, 界面线程查询、后台线程写入)"""
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                id INTEGER PRIMARY KEY,
+                doc TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                source TEXT NOT NULL,
+                text TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                updated REAL NOT NULL,
+                UNIQUE (doc, page, source)
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(tokens, tokenize='unicode61');
+        """)
+        self._conn.commit()
+
+    def add_page(self, doc, page, text, source="text"):
+        """写入/更新一页(page从1开始, 0表示整个文档); 内容未变化则跳过
+
+        source: "text"=文本层, "ocr"=OCR识别结果, "answer:<问题摘要>"=模型对该文档的回答
+        """
+        text = text.strip()
+        if not text:
+            return
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, digest FROM pages WHERE doc=? AND page=? AND source=?",
+                (doc, page, source)).fetchone()
+            if row and row[1] == digest:
+                return
+            with self._conn:
+                if row:
+                    rowid = row[0]
+                    self._conn.execute("UPDATE pages SET text=?, digest=?, updated=? WHERE id=?",
+                                       (text, digest, time.time(), rowid))
+                    self._conn.execute("DELETE FROM pages_fts WHERE rowid=?", (rowid,))
+                else:
+                    rowid = self._conn.execute(
+                        "INSERT INTO pages (doc, page, source, text, digest, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                        (doc, page, source, text, digest, time.time())).lastrowid
+                self._conn.execute("INSERT INTO pages_fts (rowid, tokens) VALUES (?, ?)",
+                                   (rowid, " ".join(tokenize(text))))
+
+    def search(self, query, limit=20):
+        """检索, 返回按相关度排序的 [{"doc", "page", "source", "snippet"}]"""
+        words = WORD_RE.findall(query)
+        if not words:
+            return []
+        # 每个词的分词结果组成一个短语, 多个词之间为 AND
+        phrases = []
+        single_chars = []
+        for word in words:
+            tokens = tokenize(word)
+            if len(tokens) == 1 and CJK_RE.fullmatch(tokens[0]) and len(tokens[0]) == 1:
+                single_chars.append(tokens[0])  # 单个汉字不在二元组索引中, 单独处理
+            else:
+                phrases.append('"' + " ".join(t.replace('"', '""') for t in tokens) + '"')
+
+        with self._lock:
+            if phrases:
+                sql = ("SELECT p.doc, p.page, p.source, p.text FROM pages_fts"
+                       " JOIN pages p ON p.id = pages_fts.rowid"
+                       " WHERE pages_fts MATCH ?")
+                params = [" ".join(phrases)]
+                for ch in single_chars:
+                    sql += " AND p.text LIKE ?"
+                    params.append(f"%{ch}%")
+                sql += " ORDER BY bm25(pages_fts) LIMIT ?"
+            else:
+                sql = "SELECT doc, page, source, text FROM pages WHERE 1"
+                params = []
+                for ch in single_chars:
+                    sql += " AND text LIKE ?"
+                    params.append(f"%{ch}%")
+                sql += " ORDER BY updated DESC LIMIT ?"
+            params.append(limit)
+            rows = self._conn.execute(sql, params).fetchall()
+
+        return [{"doc": doc, "page": page, "source": source, "snippet": make_snippet(text, words)}
+                for doc, page, source, text in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def make_snippet(text, words):
+    """截取第一个命中位置附近的文字, 命中词用【】标出"""
+    lower = text.lower()
+    hits = [(lower.find(w.lower()), w) for w in words]
+    hits = [(pos, w) for pos, w in hits if pos >= 0]
+    if not hits:
+        return text[:SNIPPET_CHARS * 2].replace("\n", " ")
+    pos, word = min(hits)
+    start = max(0, pos - SNIPPET_CHARS)
+    end = min(len(text), pos + len(word) + SNIPPET_CHARS)
+    snippet = (text[start:pos] + "【" + text[pos:pos + len(word)] + "】"
+               + text[pos + len(word):end]).replace("\n", " ")
+    if start > 0:
+        snippet = "..." + snippet
+    if end < len(text):
+        snippet += "..."
+    return snippet
@@ -0,0 +1,188 @@
+# EduMind 流式 JSON 解析
+# 功能: 知识点抽取要求模型输出 {"knowledgePoints": [{...}, ...], ...},
+#       这里边接收流式输出边解析, 每个知识点对象的右花括号一到就立即产出,
+#       输出在 max_tokens 处被截断时, 已完整的知识点全部保留。
+#
+# 用法:
+#     parser = KnowledgePointStream()
+#     for point in parser.iter(stream_chat(BASE_URL, headers, data, 120, token)):
+#         deduper.add([point])        # 去重、显示、建索引等可以提前开始
+#     result = parser.result()        # 完整结果; 截断时 result["truncated"] 为 True
+
+import json
+
+ITEMS_KEY = "knowledgePoints"
+
+# JSON 中字符串之外允许出现的其他字符(分隔符、空白、数字、true/false/null)
+_LITERAL_CHARS = frozenset(",: \t\r\n0123456789+-.eEtruefalsn")
+
+
+class KnowledgePointStream:
+    """增量解析器: 只跟踪字符串/转义/嵌套深度, 不回溯, 每个字符处理一次
+
+    顶层 JSON 之前的说明文字、```json 代码块标记会被忽略。说明文字中的括号(如 "[第1页]"、
+    示例 {"a": 1})闭合后既不含知识点数组又没有产出知识点时, 放弃它继续寻找真正的顶层 JSON;
+    括号内出现 JSON 不允许的字符(如中文、未配对引号之后的文字)时, 从该括号之后重新扫描。
+    顶层直接是数组时, 数组元素即为知识点。
+    """
+
+    def __init__(self, items_key=ITEMS_KEY):
+        self.items_key = items_key
+        self.items = []  # 已产出的知识点
+        self._buf = []  # 收到的全部文本(按块)
+        self._pos = 0  # 已扫描的字符总数
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None  # 当前字符串(深度1的键)的起始位置
+        self._last_string = None  # 深度1最近一个完整字符串
+        self._key = None  # 深度1当前的键
+        self._array_depth = None  # 知识点数组所在的深度
+        self._item = None  # 当前知识点对象的文本片段
+        self._root_start = None
+        self._root_end = None
+        self._root_items = 0  # 顶层开始时已产出的知识点数
+        self._data = None  # 顶层 JSON 的解析结果
+
+    def feed(self, chunk):
+        """喂入一段文本, 返回本段中新完成的知识点"""
+        if self._root_end is not None:
+            return []
+        self._buf.append(chunk)
+        start = self._pos
+        self._pos = start + len(chunk)
+        done = []
+        while chunk:
+            restart = self._scan(chunk, start, done)
+            if restart is None:
+                break
+            chunk, start = self._text(restart, self._pos), restart
+        return done
+
+    def _scan(self, chunk, start, done):
+        """扫描 chunk(在全部文本中的起始位置为 start), 完成的知识点追加到 done;
+        候选顶层被放弃时返回需要重新扫描的起始位置"""
+        seg_start = 0  # 当前知识点在本块中的起始下标
+        for i, ch in enumerate(chunk):
+            pos = start + i
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._string_start is not None:
+                        self._last_string = self._text(self._string_start, pos + 1)
+                        self._string_start = None
+                continue
+
+            if self._depth == 0:
+                # 顶层 JSON 之外的文字一律忽略
+                if ch == "{" or ch == "[":
+                    self._root_start = pos
+                    self._root_items = len(self.items)
+                    self._depth = 1
+                    if ch == "[":
+                        self._array_depth = 1
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._array_depth != 1:
+                    self._string_start = pos
+            elif ch == ":" and self._depth == 1:
+                self._key = self._decode_key(self._last_string)
+            elif ch == "," and self._depth == 1:
+                self._key = None
+            elif ch == "{" or ch == "[":
+                if ch == "[" and self._depth == 1 and self._key == self.items_key:
+                    self._array_depth = 2
+                elif ch == "{" and self._depth == self._array_depth:
+                    self._item = []
+                    seg_start = i
+                self._depth += 1
+            elif ch == "}" or ch == "]":
+                self._depth -= 1
+                if self._depth == 0:
+                    if self._accept_root(pos):
+                        self._root_end = pos
+                        break
+                    self._reset_root()
+                    continue
+                if self._item is not None and self._depth == self._array_depth:
+                    self._item.append(chunk[seg_start:i + 1])
+                    point = self._parse_item("".join(self._item))
+                    self._item = None
+                    if point is not None:
+                        self.items.append(point)
+                        done.append(point)
+                elif self._depth < (self._array_depth or 0):
+                    self._array_depth = None  # 知识点数组结束
+            elif ch not in _LITERAL_CHARS and len(self.items) == self._root_items:
+                # 不是 JSON: 放弃这个候选, 从它的起始括号之后重新扫描
+                begin = self._root_start + 1
+                self._reset_root()
+                return begin
+        if self._item is not None:
+            # 知识点跨块: 保存本块中的部分, 下一块从头接上
+            self._item.append(chunk[seg_start:])
+        return None
+
+    def _accept_root(self, end):
+        """候选顶层闭合: 含知识点数组的对象, 或已从中产出知识点, 才算真正的顶层"""
+        try:
+            data = json.loads(self._text(self._root_start, end + 1))
+        except ValueError:
+            data = None
+        if isinstance(data, dict) and self.items_key in data:
+            self._data = data
+            return True
+        if len(self.items) > self._root_items:
+            self._data = data
+            return True
+        return False
+
+    def _reset_root(self):
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._root_start = None
+        self._array_depth = None
+        self._key = None
+        self._last_string = None
+        self._string_start = None
+        self._item = None
+
+    def iter(self, chunks):
+        """逐块喂入, 逐个产出完成的知识点"""
+        for chunk in chunks:
+            yield from self.feed(chunk)
+
+    def result(self):
+        """完整结果; 输出被截断或无法解析时, 返回已完整的知识点并标记 truncated"""
+        if isinstance(self._data, dict):
+            return self._data
+        if isinstance(self._data, list):
+            return {self.items_key: self._data}
+        return {self.items_key: list(self.items), "truncated": True}
+
+    def _text(self, begin, end):
+        return "".join(self._buf)[begin:end]
+
+    @staticmethod
+    def _decode_key(raw):
+        if raw is None:
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _parse_item(text):
+        try:
+            point = json.loads(text)
+        except ValueError:
+            return None
+        return point if isinstance(point, dict) else None
@@ -6,18 +6,24 @@ sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 import tkinter as tk
 from tkinter import ttk, scrolledtext
 import base64
-import requests
+import hashlib
+import queue
+import re
+import threading
+from collections import OrderedDict
 import fitz
 import tempfile
 import os
 
+# 复用上级目录的API封装(可取消、相同请求合并)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api_client import CancelToken, CancelledError, coalescer
+
 # 尝试导入matplotlib用于渲染公式
 try:
     import matplotlib
     matplotlib.use('TkAgg')
-    import matplotlib.pyplot as plt
-    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-    from matplotlib.figure import Figure
+    from matplotlib import mathtext
     HAS_MATPLOTLIB = True
 except:
     HAS_MATPLOTLIB = False
@@ -26,6 +32,264 @@ API_KEY = "sk-oeylqxanedjvgrdlcrtdfogtecfmmijijpnapdijryosfgsy"
 BASE_URL = "https://api.siliconflow.cn/v1/chat/completions"
 PDF_PATH = "F:/编程项目/0011/测试.pdf"
 
+# 公式提取正则(预编译, 避免每次点击重新编译)
+# 匹配 \(...\) 或 $...$ 格式的公式
+FORMULA_RE = re.compile(r'\\\((.*?)\\\)|\$([^$]+)\$')
+# 其他格式的兜底匹配
+FORMULA_FALLBACK_RE = re.compile(r'\\frac\{[^}]+\}\{[^}]+\}|E_\d\s*=\s*[^,\n]+')
+WHITESPACE_RE = re.compile(r'\s+')
+
+# 公式渲染缓存: 内存LRU条数上限 + 磁盘目录
+FORMULA_CACHE_DIR = os.path.join(tempfile.gettempdir(), "edumind_formula_cache")
+FORMULA_CACHE_SIZE = 512
+FORMULA_DPI = 120
+# 缓存格式版本, 栅格化方式变化时递增, 旧缓存自动失效
+FORMULA_CACHE_VERSION = 1
+# 公式条带中每个格子的尺寸(像素)
+FORMULA_CELL_WIDTH = 240
+FORMULA_CELL_HEIGHT = 90
+
+
+def normalize_latex(latex):
+    """规范化LaTeX源码(去首尾空白、合并连续空白), 作为缓存键的依据"""
+    return WHITESPACE_RE.sub(" ", latex).strip()
+
+
+def extract_formulas(text):
+    """从识别结果中提取全部公式, 规范化后按出现顺序去重"""
+    formulas = [a or b for a, b in FORMULA_RE.findall(text)]
+    if not formulas:
+        formulas = FORMULA_FALLBACK_RE.findall(text)
+    seen = set()
+    result = []
+    for formula in formulas:
+        formula = normalize_latex(formula)
+        if formula and formula not in seen:
+            seen.add(formula)
+            result.append(formula)
+    return result
+
+
+def rasterize_formula(latex, dpi=FORMULA_DPI):
+    """用mathtext把公式栅格化为PNG字节, 失败返回空字节串"""
+    buf = io.BytesIO()
+    try:
+        mathtext.math_to_image(f"${latex}$", buf, dpi=dpi, format="png")
+    except Exception:
+        return b""
+    return buf.getvalue()
+
+
+class FormulaCache:
+    """公式渲染缓存: 以规范化LaTeX为键, 存PNG字节(内存LRU + 磁盘)
+
+    b"" 表示该公式渲染失败, 只记在内存中(本次运行不再重试), 不写磁盘,
+    下次启动或升级matplotlib后会重新渲染。
+    """
+
+    def __init__(self, cache_dir=FORMULA_CACHE_DIR, max_items=FORMULA_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_items = max_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+        except OSError:
+            self.cache_dir = None  # 磁盘不可写时只用内存缓存
+
+    @staticmethod
+    def make_key(latex, dpi=FORMULA_DPI):
+        # 键包含DPI、缓存格式版本和matplotlib版本, 任一变化都会重新渲染
+        mpl_version = matplotlib.__version__ if HAS_MATPLOTLIB else ""
+        source = f"{FORMULA_CACHE_VERSION}|{mpl_version}|{dpi}|{normalize_latex(latex)}"
+        return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".png")
+
+    def get_memory(self, key):
+        """只查内存(供UI线程同步使用), 未命中返回None"""
+        with self._lock:
+            png = self._memory.get(key)
+            if png is not None:
+                self._memory.move_to_end(key)
+            return png
+
+    def get(self, key):
+        """查内存, 再查磁盘; 磁盘命中会提升到内存"""
+        png = self.get_memory(key)
+        if png is not None or not self.cache_dir:
+            return png
+        try:
+            with open(self._path(key), "rb") as f:
+                png = f.read()
+        except OSError:
+            return None
+        if not png:
+            return None
+        self._remember(key, png)
+        return png
+
+    def put(self, key, png):
+        self._remember(key, png)
+        if not self.cache_dir or not png:
+            return
+        # 先写临时文件再替换, 避免留下半截图片
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(png)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def _remember(self, key, png):
+        with self._lock:
+            self._memory[key] = png
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+
+class FormulaRenderer:
+    """后台公式渲染线程: 只渲染提交时仍然可见的公式, 结果经 root.after 回到UI线程"""
+
+    def __init__(self, root, cache):
+        self.root = root
+        self.cache = cache
+        self._queue = queue.Queue()
+        self._pending = set()
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def submit(self, strip, generation, index, key, latex):
+        job_id = (id(strip), generation, index)
+        if job_id in self._pending:
+            return
+        self._pending.add(job_id)
+        self._queue.put((strip, generation, index, key, latex))
+
+    def _worker(self):
+        while True:
+            strip, generation, index, key, latex = self._queue.get()
+            try:
+                # 已经滚出视野或公式列表已更换: 跳过, 不浪费CPU
+                first, last = strip.visible_range
+                if generation != strip.generation or not first <= index <= last:
+                    continue
+                png = self.cache.get(key)
+                if png is None:
+                    png = rasterize_formula(latex)
+                    self.cache.put(key, png)
+                self.root.after(0, strip.on_rendered, generation, index, png)
+            finally:
+                self._pending.discard((id(strip), generation, index))
+
+
+class FormulaStrip(ttk.Frame):
+    """虚拟化的公式横向滚动条带: 只为可见格子创建图像, 滚出视野即释放"""
+
+    def __init__(self, master, cache, renderer):
+        super().__init__(master)
+        self.cache = cache
+        self.renderer = renderer
+
+        self.formulas = []  # [(缓存键, 规范化LaTeX)]
+        self.generation = 0  # 每次更换公式列表递增, 用于丢弃过期的渲染结果
+        self.visible_range = (0, -1)
+        self._items = {}  # 格子序号 -> 画布元素id列表
+        self._photos = {}  # 格子序号 -> PhotoImage(必须持有引用, 否则被回收)
+
+        self.canvas = tk.Canvas(self, height=FORMULA_CELL_HEIGHT, bg="white", highlightthickness=0)
+        self.canvas.pack(fill=tk.X)
+        scrollbar = ttk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.on_scroll)
+        scrollbar.pack(fill=tk.X)
+        self.canvas.config(xscrollcommand=scrollbar.set)
+
+        self.canvas.bind("<Configure>", lambda e: self.refresh())
+        self.canvas.bind("<MouseWheel>", self.on_mousewheel)
+
+    def set_formulas(self, formulas):
+        self.generation += 1
+        self.canvas.delete("all")
+        self._items.clear()
+        self._photos.clear()
+        self.formulas = [(FormulaCache.make_key(f), normalize_latex(f)) for f in formulas]
+        self.canvas.config(scrollregion=(0, 0, len(self.formulas) * FORMULA_CELL_WIDTH, FORMULA_CELL_HEIGHT))
+        self.canvas.xview_moveto(0)
+        self.refresh()
+
+    def on_scroll(self, *args):
+        self.canvas.xview(*args)
+        self.refresh()
+
+    def on_mousewheel(self, event):
+        self.canvas.xview_scroll(-1 if event.delta > 0 else 1, "units")
+        self.refresh()
+
+    def refresh(self):
+        """根据当前滚动位置计算可见格子, 释放不可见的, 补齐可见的"""
+        if not self.formulas:
+            return
+        left = self.canvas.canvasx(0)
+        width = max(self.canvas.winfo_width(), FORMULA_CELL_WIDTH)
+        first = max(0, int(left // FORMULA_CELL_WIDTH))
+        last = min(len(self.formulas) - 1, int((left + width) // FORMULA_CELL_WIDTH))
+        self.visible_range = (first, last)
+
+        for index in list(self._items):
+            if not first <= index <= last:
+                self._clear_cell(index)
+
+        for index in range(first, last + 1):
+            if index in self._items:
+                continue
+            key, latex = self.formulas[index]
+            png = self.cache.get_memory(key)
+            if png is None:
+                self._draw_text(index, "渲染中...")
+                self.renderer.submit(self, self.generation, index, key, latex)
+            else:
+                self._draw_png(index, png)
+
+    def on_rendered(self, generation, index, png):
+        first, last = self.visible_range
+        if generation != self.generation or not first <= index <= last:
+            return
+        self._clear_cell(index)
+        self._draw_png(index, png)
+
+    def _clear_cell(self, index):
+        for item in self._items.pop(index, []):
+            self.canvas.delete(item)
+        self._photos.pop(index, None)
+
+    def _draw_text(self, index, text):
+        x = index * FORMULA_CELL_WIDTH + FORMULA_CELL_WIDTH // 2
+        item = self.canvas.create_text(x, FORMULA_CELL_HEIGHT // 2, text=text,
+                                       width=FORMULA_CELL_WIDTH - 10, fill="gray")
+        self._items[index] = [item]
+
+    def _draw_png(self, index, png):
+        if not png:
+            self._draw_text(index, f"[渲染失败] {self.formulas[index][1][:40]}")
+            return
+        photo = tk.PhotoImage(data=base64.b64encode(png).decode("ascii"))
+        # 过宽/过高的公式整数倍缩小, 保证落在格子内
+        factor = max(1,
+                     -(-photo.width() // (FORMULA_CELL_WIDTH - 10)),
+                     -(-photo.height() // (FORMULA_CELL_HEIGHT - 10)))
+        if factor > 1:
+            photo = photo.subsample(factor)
+        x = index * FORMULA_CELL_WIDTH + FORMULA_CELL_WIDTH // 2
+        items = [
+            self.canvas.create_image(x, FORMULA_CELL_HEIGHT // 2, image=photo),
+            self.canvas.create_line((index + 1) * FORMULA_CELL_WIDTH, 5,
+                                    (index + 1) * FORMULA_CELL_WIDTH, FORMULA_CELL_HEIGHT - 5, fill="#ddd"),
+        ]
+        self._items[index] = items
+        self._photos[index] = photo
+
 class OCRCompareApp:
     def __init__(self, root):
         self.root = root
@@ -35,7 +299,12 @@ class OCRCompareApp:
         self.ocr_result = ""
         self.qwen_result = ""
 
+        self.formula_cache = FormulaCache()
+        self.formula_renderer = FormulaRenderer(self.root, self.formula_cache)
+        self.cancel_token = None  # 正在进行的识别任务的取消令牌
+
         self.setup_ui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def setup_ui(self):
         # 顶部控制栏
@@ -70,8 +339,8 @@ class OCRCompareApp:
         self.formula_frame = ttk.LabelFrame(self.root, text="公式渲染预览 (点击'渲染公式预览')", padding=5)
         self.formula_frame.pack(fill=tk.X, padx=10, pady=(0,10))
 
-        self.formula_canvas_frame = ttk.Frame(self.formula_frame)
-        self.formula_canvas_frame.pack(fill=tk.X)
+        self.formula_strip = FormulaStrip(self.formula_frame, self.formula_cache, self.formula_renderer)
+        self.formula_strip.pack(fill=tk.X)
 
     def pdf_to_base64(self, dpi=150):
         doc = fitz.open(PDF_PATH)
@@ -82,7 +351,7 @@ class OCRCompareApp:
         doc.close()
         return base64.b64encode(img_bytes).decode("utf-8")
 
-    def call_ocr(self, b64_image):
+    def call_ocr(self, b64_image, token=None):
         data = {
             "model": "deepseek-ai/DeepSeek-OCR",
             "messages": [{
@@ -95,14 +364,13 @@ class OCRCompareApp:
             "max_tokens": 8000
         }
         headers = {"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"}
-        resp = requests.post(BASE_URL, headers=headers, json=data, timeout=180)
-        result = resp.json()
+        result = coalescer.post_json(BASE_URL, headers, data, 180, token)
         if "choices" in result:
             return result["choices"][0]["message"]["content"]
         else:
             return f"错误: {result.get('message', result)}"
 
-    def call_qwen(self, b64_image):
+    def call_qwen(self, b64_image, token=None):
         data = {
             "model": "Qwen/Qwen2.5-VL-72B-Instruct",
             "messages": [{
@@ -115,84 +383,76 @@ class OCRCompareApp:
             "max_tokens": 8000
         }
         headers = {"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"}
-        resp = requests.post(BASE_URL, headers=headers, json=data, timeout=180)
-        result = resp.json()
+        result = coalescer.post_json(BASE_URL, headers, data, 180, token)
         if "choices" in result:
             return result["choices"][0]["message"]["content"]
         else:
             return f"错误: {result.get('message', result)}"
 
     def start_recognition(self):
+        # 重新识别时中断上一次未完成的任务
+        if self.cancel_token is not None:
+            self.cancel_token.cancel()
+        token = CancelToken()
+        self.cancel_token = token
         self.status_var.set("正在转换PDF...")
-        self.root.update()
+        threading.Thread(target=self.run_recognition, args=(token,), daemon=True).start()
+
+    def run_recognition(self, token):
+        """后台线程中依次调用两个模型, 结果经 root.after 回到UI线程; 已取消则丢弃"""
+        def post_ui(func, *args):
+            self.root.after(0, lambda: None if token.cancelled else func(*args))
 
         try:
             b64 = self.pdf_to_base64()
 
             # 调用DeepSeek-OCR
-            self.status_var.set("正在调用 DeepSeek-OCR...")
-            self.root.update()
-            self.ocr_result = self.call_ocr(b64)
-            self.ocr_text.delete(1.0, tk.END)
-            self.ocr_text.insert(tk.END, self.ocr_result)
+            post_ui(self.status_var.set, "正在调用 DeepSeek-OCR...")
+            ocr_result = self.call_ocr(b64, token)
+            post_ui(self.show_result, "ocr", ocr_result)
 
             # 调用Qwen
-            self.status_var.set("正在调用 Qwen2.5-VL-72B...")
-            self.root.update()
-            self.qwen_result = self.call_qwen(b64)
-            self.qwen_text.delete(1.0, tk.END)
-            self.qwen_text.insert(tk.END, self.qwen_result)
+            post_ui(self.status_var.set, "正在调用 Qwen2.5-VL-72B...")
+            qwen_result = self.call_qwen(b64, token)
+            post_ui(self.show_result, "qwen", qwen_result)
 
-            self.status_var.set("识别完成! 可点击'渲染公式预览'查看公式效果")
+            post_ui(self.status_var.set, "识别完成! 可点击'渲染公式预览'查看公式效果")
+
+        except CancelledError:
+            pass
 
         except Exception as e:
-            self.status_var.set(f"错误: {e}")
+            post_ui(self.status_var.set, f"错误: {e}")
+
+    def show_result(self, which, result):
+        if which == "ocr":
+            self.ocr_result = result
+            widget = self.ocr_text
+        else:
+            self.qwen_result = result
+            widget = self.qwen_text
+        widget.delete(1.0, tk.END)
+        widget.insert(tk.END, result)
+
+    def on_close(self):
+        # 关闭窗口时立即中断进行中的请求, 不再等待服务器返回
+        if self.cancel_token is not None:
+            self.cancel_token.cancel()
+        self.root.destroy()
 
     def render_formulas(self):
         if not HAS_MATPLOTLIB:
             self.status_var.set("需要安装matplotlib: pip install matplotlib")
             return
 
-        # 清空之前的渲染
-        for widget in self.formula_canvas_frame.winfo_children():
-            widget.destroy()
-
-        # 从OCR结果中提取一些公式进行渲染
-        import re
-        # 匹配 \(...\) 或 $...$ 格式的公式
-        formulas = re.findall(r'\\\((.*?)\\\)|\$([^$]+)\$', self.ocr_result)
-        formulas = [f[0] or f[1] for f in formulas][:8]  # 最多显示8个
-
-        if not formulas:
-            # 尝试匹配其他格式
-            formulas = re.findall(r'\\frac\{[^}]+\}\{[^}]+\}|E_\d\s*=\s*[^,\n]+', self.ocr_result)[:8]
-
+        formulas = extract_formulas(self.ocr_result)
         if not formulas:
             self.status_var.set("未找到可渲染的LaTeX公式")
             return
 
-        # 创建matplotlib图形
-        fig = Figure(figsize=(14, 2), dpi=100)
-
-        for i, formula in enumerate(formulas[:4]):
-            ax = fig.add_subplot(1, 4, i+1)
-            ax.axis('off')
-            try:
-                # 清理公式
-                formula = formula.strip()
-                ax.text(0.5, 0.5, f"${formula}$", fontsize=12, ha='center', va='center',
-                       transform=ax.transAxes)
-            except:
-                ax.text(0.5, 0.5, "[渲染失败]", fontsize=10, ha='center', va='center')
-
-        fig.tight_layout()
-
-        canvas = FigureCanvasTkAgg(fig, master=self.formula_canvas_frame)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill=tk.X)
-
-        self.status_var.set(f"已渲染 {min(len(formulas), 4)} 个公式")
-
+        # 已缓存的公式直接显示, 其余在后台渲染, 只渲染可见部分
+        self.formula_strip.set_formulas(formulas)
+        self.status_var.set(f"共 {len(formulas)} 个公式, 可左右滚动查看")
 
 if __name__ == "__main__":
     root = tk.Tk()
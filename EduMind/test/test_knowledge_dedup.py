@@ -0,0 +1,61 @@
+# 知识点去重回归测试
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from knowledge_dedup import dedupe_knowledge_points
+
+
+def test_formulas_differing_in_operators_are_kept():
+    points = [
+        {"id": "1", "type": "theorem", "content": "完全平方公式：(a+b)^2=a^2+2ab+b^2", "sourcePages": [1]},
+        {"id": "2", "type": "theorem", "content": "完全平方公式：(a-b)^2=a^2-2ab+b^2", "sourcePages": [1]},
+        {"id": "3", "type": "theorem", "content": "不等式：a>b 时 a+c>b+c", "sourcePages": [2]},
+        {"id": "4", "type": "theorem", "content": "不等式：a<b 时 a+c<b+c", "sourcePages": [2]},
+    ]
+    result = dedupe_knowledge_points(points)
+    assert [p["id"] for p in result] == ["1", "2", "3", "4"]
+
+
+def test_punctuation_variants_are_merged_with_pages():
+    points = [
+        {"id": "1", "type": "concept", "content": "牛顿第一定律：一切物体在没有受到力的作用时，总保持静止状态或匀速直线运动状态。",
+         "sourcePages": [1]},
+        {"id": "b1_1", "type": "concept", "content": "牛顿第一定律: 一切物体在没有受到力的作用时, 总保持静止状态或匀速直线运动状态",
+         "sourcePages": [2]},
+    ]
+    result = dedupe_knowledge_points(points)
+    assert len(result) == 1
+    assert result[0]["sourcePages"] == [1, 2]
+
+
+def test_different_types_are_not_merged():
+    content = "动能定理：合外力对物体所做的功等于物体动能的变化量。"
+    points = [
+        {"id": "1", "type": "theorem", "content": content},
+        {"id": "2", "type": "example", "content": content},
+    ]
+    assert len(dedupe_knowledge_points(points)) == 2
+
+
+def test_children_of_merged_parent_move_to_kept_point():
+    content = "牛顿运动定律：描述物体运动与所受力之间关系的三条基本定律。"
+    points = [
+        {"id": "1", "type": "concept", "content": content, "children": ["2"]},
+        {"id": "2", "type": "theorem", "content": "牛顿第一定律：惯性定律。", "parentId": "1"},
+        {"id": "b1", "type": "concept", "content": content, "children": ["x2"]},
+        {"id": "x2", "type": "theorem", "content": "牛顿第二定律：F=ma。", "parentId": "b1"},
+    ]
+    result = {p["id"]: p for p in dedupe_knowledge_points(points)}
+    assert sorted(result) == ["1", "2", "x2"]
+    assert result["x2"]["parentId"] == "1"
+    assert result["1"]["children"] == ["2", "x2"]
+
+
+if __name__ == "__main__":
+    test_formulas_differing_in_operators_are_kept()
+    test_punctuation_variants_are_merged_with_pages()
+    test_different_types_are_not_merged()
+    test_children_of_merged_parent_move_to_kept_point()
+    print("✅ 知识点去重测试通过")
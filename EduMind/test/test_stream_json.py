@@ -0,0 +1,77 @@
+# 流式 JSON 解析回归测试
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stream_json import KnowledgePointStream
+
+POINTS = [
+    {"id": "1", "content": "括号{}[]和引号\"在字符串里", "page": 1},
+    {"id": "2", "content": "反斜杠\\\\结尾\\", "children": ["3"]},
+    {"id": "3", "content": "嵌套", "extra": {"a": [1, {"b": "}"}]}},
+]
+RESULT = {"knowledgePoints": POINTS, "summary": "小结"}
+TEXT = json.dumps(RESULT, ensure_ascii=False)
+
+
+def feed_split(text, *cuts):
+    """按给定位置切块喂入, 返回 (产出的知识点, result())"""
+    parser = KnowledgePointStream()
+    bounds = [0, *cuts, len(text)]
+    out = []
+    for a, b in zip(bounds, bounds[1:]):
+        out.extend(parser.feed(text[a:b]))
+    return out, parser.result()
+
+
+def test_every_chunk_boundary():
+    for i in range(len(TEXT) + 1):
+        out, result = feed_split(TEXT, i)
+        assert out == POINTS, i
+        assert result == RESULT, i
+    out, result = feed_split(TEXT, *range(1, len(TEXT)))  # 逐字喂入
+    assert out == POINTS and result == RESULT
+
+
+def test_truncated_mid_item_keeps_complete_items():
+    cut = TEXT.index('{"id": "3"') + 15
+    for i in range(cut + 1):
+        out, result = feed_split(TEXT[:cut], i)
+        assert out == POINTS[:2], i
+        assert result == {"knowledgePoints": POINTS[:2], "truncated": True}
+
+
+def test_prose_and_code_fence_before_json():
+    for prefix in ("好的, 结果如下:\n```json\n", "根据[第1页]内容: ", "注意[\"引号] ", "见{附录}和[1,2]: "):
+        text = prefix + TEXT + "\n```\n以上。"
+        for i in range(len(text) + 1):
+            out, result = feed_split(text, i)
+            assert out == POINTS, (prefix, i)
+            assert result == RESULT, (prefix, i)
+
+
+def test_example_json_in_prose_is_skipped():
+    text = '示例 {"a": 1} 和 ["x"] 实际: {"knowledgePoints":[{"id":"1"}]}'
+    for i in range(len(text) + 1):
+        out, result = feed_split(text, i)
+        assert out == [{"id": "1"}], i
+        assert result == {"knowledgePoints": [{"id": "1"}]}, i
+
+
+def test_top_level_array():
+    text = "结果: " + json.dumps(POINTS, ensure_ascii=False)
+    for i in range(len(text) + 1):
+        out, result = feed_split(text, i)
+        assert out == POINTS, i
+        assert result == {"knowledgePoints": POINTS}, i
+
+
+if __name__ == "__main__":
+    test_every_chunk_boundary()
+    test_truncated_mid_item_keeps_complete_items()
+    test_prose_and_code_fence_before_json()
+    test_example_json_in_prose_is_skipped()
+    test_top_level_array()
+    print("✅ 流式 JSON 解析测试通过")
@@ -0,0 +1,149 @@
+# .zsdb 二进制进度文件回归测试
+import base64
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zsd_binary import HEADER, PAGE_ENTRY, ZsdBusyError, ZsdContainer, ZsdFormatError, _dumps
+
+PDF_BYTES = b"%PDF-1.4\n" + bytes(range(256)) * 8
+APP = {"name": "讲义.pdf", "contentCursor": 3, "knowledgePoints": [{"id": "d1", "content": "文档级"}]}
+
+
+def _create(tmp, raw=PDF_BYTES, file_type="pdf", total_size=3):
+    path = os.path.join(tmp, "a.zsdb")
+    return path, ZsdContainer.create(path, raw, file_type, "讲义." + file_type, total_size, APP,
+                                     processed_offset=1, created_at=1700000000000)
+
+
+def test_header_is_64_bytes():
+    assert HEADER.size == 64
+    assert PAGE_ENTRY.size == 32
+
+
+def test_v3_roundtrip_pdf_and_txt():
+    with tempfile.TemporaryDirectory() as tmp:
+        for file_type, raw in (("pdf", PDF_BYTES), ("txt", "第一章 力与运动\n".encode("utf-8"))):
+            zsd_data = {
+                "version": 3, "createdAt": 1700000000000,
+                "rawContent": base64.b64encode(raw).decode("ascii") if file_type == "pdf" else raw.decode("utf-8"),
+                "originalFileType": file_type, "originalFileName": "讲义." + file_type,
+                "processedOffset": 2, "totalSize": 3 if file_type == "pdf" else len(raw), "app": APP,
+            }
+            zsd_path = os.path.join(tmp, "in.zsd")
+            with open(zsd_path, "w", encoding="utf-8") as f:
+                json.dump(zsd_data, f, ensure_ascii=False)
+            with ZsdContainer.import_zsd(zsd_path, os.path.join(tmp, file_type + ".zsdb")) as zsd:
+                assert zsd.page_count == (3 if file_type == "pdf" else 1)
+                assert bytes(zsd.raw) == raw
+                zsd.export_zsd(os.path.join(tmp, "out.zsd"))
+            with open(os.path.join(tmp, "out.zsd"), encoding="utf-8") as f:
+                assert json.load(f) == zsd_data
+
+
+def test_write_page_appends_only_that_page():
+    with tempfile.TemporaryDirectory() as tmp:
+        path, zsd = _create(tmp)
+        with zsd:
+            zsd.write_page(0, "第0页", [{"id": "p0"}])
+            before = open(path, "rb").read()
+            points = [{"id": "p2", "content": "牛顿第二定律"}]
+            zsd.write_page(2, "第2页", points)
+            after = open(path, "rb").read()
+            appended = "第2页".encode("utf-8") + _dumps(points)
+            assert len(after) == len(before) + len(appended)
+            assert after.endswith(appended)
+            entry = HEADER.size + 2 * PAGE_ENTRY.size
+            # 只改写了第2页的索引, 其余字节不变
+            assert after[:entry] == before[:entry]
+            assert after[entry + PAGE_ENTRY.size:len(before)] == before[entry + PAGE_ENTRY.size:]
+            assert zsd.read_page(0) == ("第0页", [{"id": "p0"}])
+            assert zsd.read_page(1) == (None, None)
+            assert zsd.read_page(2) == ("第2页", points)
+            zsd.write_page(2, points=[])  # 只更新知识点, OCR 文本保持不变
+            assert zsd.read_page(2) == ("第2页", [])
+
+
+def test_update_app_and_compact():
+    with tempfile.TemporaryDirectory() as tmp:
+        path, zsd = _create(tmp)
+        with zsd:
+            for i in range(3):
+                zsd.write_page(1, f"第1页 第{i}版" * 50, [{"id": f"v{i}"}])
+            zsd.update_app({"name": "讲义.pdf", "contentCursor": 9, "knowledgePoints": [{"id": "d2"}]})
+            zsd.set_processed_offset(2)
+            assert zsd.meta["app"] == {"name": "讲义.pdf", "contentCursor": 9}
+            assert zsd.knowledge_points() == [{"id": "d2"}, {"id": "v2"}]
+            size = os.path.getsize(path)
+            zsd.compact()
+            assert os.path.getsize(path) < size
+            assert not os.path.exists(path + ".tmp")
+            assert zsd.processed_offset == 2
+            assert bytes(zsd.raw) == PDF_BYTES
+            assert zsd.read_page(1) == ("第1页 第2版" * 50, [{"id": "v2"}])
+            assert zsd.knowledge_points() == [{"id": "d2"}, {"id": "v2"}]
+        with ZsdContainer.open(path) as zsd:
+            assert zsd.meta["app"]["contentCursor"] == 9
+
+
+def test_crc_mismatch_is_detected():
+    with tempfile.TemporaryDirectory() as tmp:
+        path, zsd = _create(tmp)
+        with zsd:
+            zsd.write_page(0, "OCR文本")
+            offset = zsd._entry(0)[0]
+        with open(path, "r+b") as f:
+            f.seek(offset)
+            f.write(b"X")
+        with ZsdContainer.open(path) as zsd:
+            try:
+                zsd.read_page(0)
+            except ZsdFormatError:
+                pass
+            else:
+                raise AssertionError("损坏的记录没有被发现")
+
+
+def test_bad_magic_is_rejected():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bad.zsdb")
+        with open(path, "wb") as f:
+            f.write(b"\0" * 128)
+        try:
+            ZsdContainer.open(path)
+        except ZsdFormatError:
+            pass
+        else:
+            raise AssertionError("不是 .zsdb 的文件被打开了")
+
+
+def test_writes_refused_while_raw_view_is_held():
+    with tempfile.TemporaryDirectory() as tmp:
+        path, zsd = _create(tmp)
+        with zsd:
+            view = zsd.raw
+            for action in (lambda: zsd.write_page(0, "x"), zsd.compact):
+                try:
+                    action()
+                except ZsdBusyError:
+                    pass
+                else:
+                    raise AssertionError("持有 raw 视图时写入没有被拒绝")
+            assert not os.path.exists(path + ".tmp")
+            del view
+            zsd.write_page(0, "x")
+            assert zsd.read_page(0) == ("x", None)
+
+
+if __name__ == "__main__":
+    test_header_is_64_bytes()
+    test_v3_roundtrip_pdf_and_txt()
+    test_write_page_appends_only_that_page()
+    test_update_app_and_compact()
+    test_crc_mismatch_is_detected()
+    test_bad_magic_is_rejected()
+    test_writes_refused_while_raw_view_is_held()
+    print("✅ .zsdb 读写测试通过")
@@ -0,0 +1,304 @@
+# EduMind 二进制进度文件(.zsdb)
+# 功能: .zsd(JSON) 的二进制容器版本, 原始文件字节不再 base64, 每页的 OCR 文本和知识点
+#       作为追加记录写入, 单页存档只追加几 KB 并原地改写 32 字节的页索引, 不需要整份重写;
+#       读取时内存映射, 按页随机访问。可与 JSON .zsd(V1/V2/V3) 互相导入导出。
+#
+# 文件布局(小端):
+#   文件头  64 字节   魔数/版本/页数/已处理偏移量/各区段位置
+#   页索引  页数 x 32 字节   每页: OCR文本(偏移,长度,CRC32) + 知识点JSON(偏移,长度,CRC32)
+#   原始内容           原始文件字节(PDF/图片原样, 文本为UTF-8)
+#   追加记录           OCR文本、知识点JSON、元数据JSON; 被新记录取代的旧记录留作空洞, compact() 时清理
+
+import base64
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+
+MAGIC = b"ZSDB"
+FORMAT_VERSION = 1
+
+# 魔数, 格式版本, 保留, 页数, 已处理偏移量, 原始内容(偏移,长度), 元数据(偏移,长度), 文档级知识点(偏移,长度)
+HEADER = struct.Struct("<4sHHIIQQQQQQ")  # 共 64 字节
+# OCR文本(偏移,长度,CRC32), 知识点(偏移,长度,CRC32)
+PAGE_ENTRY = struct.Struct("<QIIQII")
+
+# 原始内容以二进制存储的文件类型, 其余按文本(UTF-8)存储
+BINARY_FILE_TYPES = ("pdf", "png", "jpg", "jpeg")
+
+
+class ZsdFormatError(Exception):
+    """文件不是有效的 .zsdb 或内容已损坏"""
+
+
+class ZsdBusyError(Exception):
+    """仍有 raw 视图指向映射区域, 不能写入或关闭"""
+
+
+def _dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _units_for(file_type, total_size):
+    """页索引条数: PDF=页数, 图片和文本=1(与前端 totalSize 一致)"""
+    if file_type == "pdf":
+        return max(int(total_size), 0)
+    return 1
+
+
+class ZsdContainer:
+    """.zsdb 读写
+
+    用法:
+        with ZsdContainer.open(path) as zsd:
+            page_bytes = bytes(zsd.raw[a:b])  # 按需从映射区读取原始文件片段
+            zsd.write_page(3, ocr_text, kps)  # 存档一页
+            zsd.set_processed_offset(4)
+
+    raw 返回指向映射区域的 memoryview, 写入/compact/close 前必须释放(del 或用完即弃),
+    否则抛出 ZsdBusyError。
+    """
+
+    def __init__(self, path, f):
+        self.path = path
+        self._f = f
+        self._mm = None
+        self._read_header()
+
+    # ---------- 创建/打开 ----------
+
+    @classmethod
+    def create(cls, path, raw_bytes, original_file_type, original_file_name, total_size, app,
+               processed_offset=0, created_at=None):
+        """新建文件; app 为 .zsd 中的 app 字典, 其中 knowledgePoints 存为文档级知识点"""
+        page_count = _units_for(original_file_type, total_size)
+        app = dict(app)
+        doc_points = app.pop("knowledgePoints", []) or []
+        meta = {
+            "createdAt": created_at if created_at is not None else int(time.time() * 1000),
+            "originalFileType": original_file_type,
+            "originalFileName": original_file_name,
+            "totalSize": total_size,
+            "app": app,
+        }
+        meta_bytes = _dumps(meta)
+        kp_bytes = _dumps(doc_points)
+
+        raw_offset = HEADER.size + page_count * PAGE_ENTRY.size
+        meta_offset = raw_offset + len(raw_bytes)
+        kp_offset = meta_offset + len(meta_bytes)
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, page_count, processed_offset,
+                                raw_offset, len(raw_bytes), meta_offset, len(meta_bytes),
+                                kp_offset, len(kp_bytes)))
+            f.write(b"\0" * (page_count * PAGE_ENTRY.size))
+            f.write(raw_bytes)
+            f.write(meta_bytes)
+            f.write(kp_bytes)
+        return cls.open(path)
+
+    @classmethod
+    def open(cls, path):
+        f = open(path, "r+b")
+        try:
+            return cls(path, f)
+        except BaseException:
+            f.close()
+            raise
+
+    def _read_header(self):
+        self._f.seek(0)
+        data = self._f.read(HEADER.size)
+        if len(data) < HEADER.size:
+            raise ZsdFormatError("文件头不完整")
+        (magic, version, _, self.page_count, self.processed_offset,
+         self._raw_offset, self._raw_length, self._meta_offset, self._meta_length,
+         self._kp_offset, self._kp_length) = HEADER.unpack(data)
+        if magic != MAGIC:
+            raise ZsdFormatError("不是 .zsdb 文件")
+        if version > FORMAT_VERSION:
+            raise ZsdFormatError(f"不支持的版本: {version}")
+
+    def close(self):
+        self._unmap()
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------- 读取(内存映射) ----------
+
+    def _map(self):
+        if self._mm is None:
+            self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mm
+
+    def _unmap(self):
+        # 追加写入前先解除映射(Windows 下映射中的文件不能改变大小)
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                raise ZsdBusyError("仍持有 raw 返回的 memoryview, 请先释放再写入/关闭") from None
+            self._mm = None
+
+    def _slice(self, offset, length):
+        return memoryview(self._map())[offset:offset + length]
+
+    @property
+    def raw(self):
+        """原始文件内容(memoryview, 直接指向映射区域, 不复制)"""
+        return self._slice(self._raw_offset, self._raw_length)
+
+    @property
+    def meta(self):
+        return json.loads(bytes(self._slice(self._meta_offset, self._meta_length)))
+
+    def _entry(self, page):
+        if not 0 <= page < self.page_count:
+            raise IndexError(f"页码超出范围: {page}")
+        offset = HEADER.size + page * PAGE_ENTRY.size
+        return PAGE_ENTRY.unpack(self._slice(offset, PAGE_ENTRY.size))
+
+    def _record(self, offset, length, crc):
+        if length == 0 and offset == 0:
+            return None
+        data = bytes(self._slice(offset, length))
+        if zlib.crc32(data) != crc:
+            raise ZsdFormatError("记录校验失败")
+        return data
+
+    def read_page(self, page):
+        """返回 (OCR文本, 知识点列表), 未存档的部分为 None"""
+        ocr_off, ocr_len, ocr_crc, kp_off, kp_len, kp_crc = self._entry(page)
+        ocr = self._record(ocr_off, ocr_len, ocr_crc)
+        kps = self._record(kp_off, kp_len, kp_crc)
+        return (ocr.decode("utf-8") if ocr is not None else None,
+                json.loads(kps) if kps is not None else None)
+
+    def knowledge_points(self):
+        """全部知识点: 文档级知识点在前, 之后按页顺序"""
+        points = list(json.loads(bytes(self._slice(self._kp_offset, self._kp_length))))
+        for page in range(self.page_count):
+            _, kps = self.read_page(page)
+            if kps:
+                points.extend(kps)
+        return points
+
+    # ---------- 写入(追加 + 原地改写) ----------
+
+    def _append(self, data):
+        """追加一条记录, 返回 (偏移, 长度, CRC32)"""
+        self._unmap()
+        self._f.seek(0, os.SEEK_END)
+        offset = self._f.tell()
+        self._f.write(data)
+        return offset, len(data), zlib.crc32(data)
+
+    def _patch(self, offset, data):
+        # 先把追加的数据同步到磁盘(fsync, flush 只交给操作系统), 再改写指针,
+        # 进程崩溃或断电时索引都不会指向未写完的记录
+        self._sync()
+        self._f.seek(offset)
+        self._f.write(data)
+        self._f.flush()
+
+    def _sync(self):
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def _write_header(self):
+        self._patch(0, HEADER.pack(MAGIC, FORMAT_VERSION, 0, self.page_count, self.processed_offset,
+                                   self._raw_offset, self._raw_length, self._meta_offset, self._meta_length,
+                                   self._kp_offset, self._kp_length))
+
+    def write_page(self, page, ocr_text=None, points=None):
+        """存档一页: 只追加本页记录并改写该页的 32 字节索引; 传 None 的部分保持不变"""
+        entry = self._entry(page)
+        ocr_ptr, kp_ptr = entry[:3], entry[3:]
+        if ocr_text is not None:
+            ocr_ptr = self._append(ocr_text.encode("utf-8"))
+        if points is not None:
+            kp_ptr = self._append(_dumps(points))
+        self._patch(HEADER.size + page * PAGE_ENTRY.size, PAGE_ENTRY.pack(*ocr_ptr, *kp_ptr))
+
+    def set_processed_offset(self, offset):
+        self.processed_offset = offset
+        self._write_header()
+
+    def update_app(self, app):
+        """更新 app 状态(游标、批次、学习上下文等); knowledgePoints 字段写入文档级知识点"""
+        app = dict(app)
+        meta = self.meta
+        if "knowledgePoints" in app:
+            self._kp_offset, self._kp_length, _ = self._append(_dumps(app.pop("knowledgePoints") or []))
+        meta["app"] = app
+        self._meta_offset, self._meta_length, _ = self._append(_dumps(meta))
+        self._write_header()
+
+    def compact(self):
+        """重写文件, 去掉被取代的旧记录"""
+        self._unmap()  # 仍持有 raw 视图时先报错, 不留下写了一半的临时文件
+        tmp = self.path + ".tmp"
+        meta = self.meta
+        app = dict(meta["app"])
+        app["knowledgePoints"] = json.loads(bytes(self._slice(self._kp_offset, self._kp_length)))
+        pages = [self.read_page(i) for i in range(self.page_count)]
+        with ZsdContainer.create(tmp, bytes(self.raw), meta["originalFileType"], meta["originalFileName"],
+                                 meta["totalSize"], app, self.processed_offset, meta["createdAt"]) as new:
+            for i, (ocr, kps) in enumerate(pages):
+                if ocr is not None or kps is not None:
+                    new.write_page(i, ocr, kps)
+            new._sync()  # 新文件完整落盘后才替换原文件
+        self.close()
+        os.replace(tmp, self.path)
+        self._f = open(self.path, "r+b")
+        self._read_header()
+
+    # ---------- 与 JSON .zsd 互转 ----------
+
+    def to_zsd(self):
+        """导出为 JSON .zsd(V3) 的字典, 按页知识点合并进 app.knowledgePoints"""
+        meta = self.meta
+        file_type = meta["originalFileType"]
+        raw = bytes(self.raw)
+        app = dict(meta["app"])
+        app["knowledgePoints"] = self.knowledge_points()
+        return {
+            "version": 3,
+            "createdAt": meta["createdAt"],
+            "rawContent": base64.b64encode(raw).decode("ascii") if file_type in BINARY_FILE_TYPES
+            else raw.decode("utf-8"),
+            "originalFileType": file_type,
+            "originalFileName": meta["originalFileName"],
+            "processedOffset": self.processed_offset,
+            "totalSize": meta["totalSize"],
+            "app": app,
+        }
+
+    def export_zsd(self, zsd_path):
+        with open(zsd_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_zsd(), f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def import_zsd(cls, zsd_path, path):
+        """从 JSON .zsd 导入; V1/V2 没有原始内容, 只保留 app 数据"""
+        with open(zsd_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or not isinstance(data.get("app"), dict):
+            raise ZsdFormatError("无效的 .zsd 文件")
+        app = data["app"]
+        if data.get("version") == 3:
+            file_type = data.get("originalFileType", "txt")
+            raw_content = data.get("rawContent", "")
+            raw = base64.b64decode(raw_content) if file_type in BINARY_FILE_TYPES else raw_content.encode("utf-8")
+            return cls.create(path, raw, file_type, data.get("originalFileName", ""),
+                              data.get("totalSize", 0), app,
+                              data.get("processedOffset", 0), data.get("createdAt"))
+        return cls.create(path, b"", app.get("fileType", "zsd"), app.get("name", ""),
+                          0, app, app.get("contentCursor", 0), data.get("createdAt"))